@@ -0,0 +1,127 @@
+import fcntl
+import os
+import tempfile
+import time
+
+
+# how long /proc/stat is sampled to tell busy cores from idle ones
+SAMPLE_SEC = 0.1
+# cores busier than this are not picked automatically
+BUSY_THRESHOLD = 0.5
+
+# the lock on the core this instance is bound to, held until the process exits
+_core_lock = None
+# the cores this process was allowed to run on before it was bound
+_allowed_cores = None
+
+
+def _lock_path(core):
+    return os.path.join(tempfile.gettempdir(), f'mini-lop-cpu{core}.lock')
+
+
+def _try_lock(core):
+    """Claim a core, so other instances can see it is taken. Returns the open lock file or None."""
+    f = open(_lock_path(core), 'a')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def read_cpu_times():
+    """Return {core: (busy, total)} jiffies from /proc/stat."""
+    times = {}
+    with open('/proc/stat') as f:
+        for line in f:
+            if not line.startswith('cpu') or line.startswith('cpu '):
+                continue
+            fields = line.split()
+            values = [int(x) for x in fields[1:]]
+            # idle and iowait
+            idle = values[3] + (values[4] if len(values) > 4 else 0)
+            times[int(fields[0][3:])] = (sum(values) - idle, sum(values))
+    return times
+
+
+def core_load(sample_sec=SAMPLE_SEC):
+    """Return {core: busy fraction} over a short sampling period."""
+    before = read_cpu_times()
+    time.sleep(sample_sec)
+    after = read_cpu_times()
+    load = {}
+    for core, (busy, total) in after.items():
+        busy_before, total_before = before.get(core, (0, 0))
+        load[core] = (busy - busy_before) / max(total - total_before, 1)
+    return load
+
+
+def pinned_cores():
+    """Cores that user processes (other fuzzers, AFL instances) have pinned themselves to, as AFL checks it."""
+    cores = set()
+    if os.cpu_count() == 1:
+        # every process is "pinned" to the only core there is
+        return cores
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                status = f.read()
+        except OSError:
+            continue
+        # kernel threads have no VmSize and are pinned to every core, skip them
+        if 'VmSize:' not in status:
+            continue
+        for line in status.splitlines():
+            if line.startswith('Cpus_allowed_list:'):
+                allowed = line.split(':', 1)[1].strip()
+                if allowed.isdigit():
+                    cores.add(int(allowed))
+    return cores
+
+
+def bind_to_core(conf):
+    """Pin this process, and with it the forkserver and every target it forks, to one core.
+
+    cpu_affinity in the config is 'auto' (default), 'off', a core number or a list of core numbers.
+    """
+    global _core_lock, _allowed_cores
+    setting = conf.get('cpu_affinity', 'auto')
+    if setting == 'off':
+        return None
+
+    allowed = os.sched_getaffinity(0)
+    if setting == 'auto':
+        taken = pinned_cores()
+        load = core_load()
+        candidates = sorted((c for c in allowed if c not in taken and load.get(c, 0) < BUSY_THRESHOLD),
+                            key=lambda c: load.get(c, 0))
+    else:
+        candidates = [setting] if isinstance(setting, int) else list(setting)
+        candidates = [c for c in candidates if c in allowed]
+
+    for core in candidates:
+        lock = _try_lock(core)
+        if lock is not None:
+            _core_lock = lock
+            _allowed_cores = allowed
+            os.sched_setaffinity(0, {core})
+            print(f"Bound to core {core}")
+            return core
+
+    print("No free core to bind to, running without CPU affinity")
+    return None
+
+
+def leave_bound_core():
+    """Move the calling process off the core bind_to_core claimed, onto the other cores it was allowed.
+
+    Used by the secondary targets, so their slow builds don't compete with the fast target for its core.
+    """
+    if _allowed_cores is None:
+        return
+    others = _allowed_cores - os.sched_getaffinity(0)
+    if others:
+        os.sched_setaffinity(0, others)
@@ -0,0 +1,80 @@
+import json
+import random
+import statistics
+
+
+# number of evenly spaced exec counts the coverage curves are compared at
+CHECKPOINTS = 10
+BOOTSTRAP_RESAMPLES = 1000
+
+
+def edges_at(timeline, execs):
+    """Edges found after the given number of execs, from a run's (execs, seconds, edges) timeline."""
+    edges = 0
+    for point_execs, _, point_edges in timeline:
+        if point_execs > execs:
+            break
+        edges = point_edges
+    return edges
+
+
+def bootstrap_median_ci(values, rng, confidence=0.95):
+    """Percentile bootstrap confidence interval of the median."""
+    if len(values) < 2:
+        return values[0], values[0]
+    medians = sorted(statistics.median(rng.choices(values, k=len(values))) for _ in range(BOOTSTRAP_RESAMPLES))
+    low = medians[int((1 - confidence) / 2 * BOOTSTRAP_RESAMPLES)]
+    high = medians[int((1 + confidence) / 2 * BOOTSTRAP_RESAMPLES) - 1]
+    return low, high
+
+
+def summarize(values, rng):
+    low, high = bootstrap_median_ci(values, rng)
+    return {
+        'median': statistics.median(values),
+        'ci95': [low, high],
+        'mean': statistics.mean(values),
+        'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+        'min': min(values),
+        'max': max(values),
+    }
+
+
+def write_report(path, conf, rng_seed, exec_budget, runs):
+    """Write every run's timeline plus summary statistics across the repeats as JSON."""
+    # the bootstrap gets its own generator, so the report does not depend on the fuzzing runs
+    rng = random.Random(rng_seed)
+    checkpoints = [exec_budget * (i + 1) // CHECKPOINTS for i in range(CHECKPOINTS)]
+    report = {
+        'target': conf['target'],
+        'seeds_folder': conf['seeds_folder'],
+        'power_schedule': conf.get('power_schedule', 'default'),
+        'rng_seed': rng_seed,
+        'exec_budget': exec_budget,
+        'repeats': len(runs),
+        'summary': {
+            'final_edges': summarize([run['timeline'][-1][2] for run in runs], rng),
+            'new_edges': summarize([run['timeline'][-1][2] - run['timeline'][0][2] for run in runs], rng),
+            'seconds': summarize([run['timeline'][-1][1] for run in runs], rng),
+            'execs_per_sec': summarize([run['timeline'][-1][0] / run['timeline'][-1][1] for run in runs], rng),
+            'edges_at_execs': [
+                dict(execs=execs, **summarize([edges_at(run['timeline'], execs) for run in runs], rng))
+                for execs in checkpoints
+            ],
+        },
+        'runs': runs,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def print_summary(report):
+    summary = report['summary']
+    for key in ['final_edges', 'new_edges', 'seconds', 'execs_per_sec']:
+        stats = summary[key]
+        print(f'{key:>14}: median {stats["median"]:.1f} (95% CI {stats["ci95"][0]:.1f}-{stats["ci95"][1]:.1f}), '
+              f'mean {stats["mean"]:.1f} +- {stats["stdev"]:.1f}')
+    print('edges vs. execs (median):')
+    for stats in summary['edges_at_execs']:
+        print(f'{stats["execs"]:>14}: {stats["median"]:.1f} (95% CI {stats["ci95"][0]:.1f}-{stats["ci95"][1]:.1f})')
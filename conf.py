@@ -1,13 +1,25 @@
 import toml
 import os
 import shutil
+from schedule import POWER_SCHEDULES
 
 
 def parse_config(config_file, overwrite_output=True):
     with open(config_file) as f:
         conf_dict = toml.load(f)
 
-        for key in ['seeds_folder', 'output_folder', 'target', 'target_args']:
+        if conf_dict.get('target_type', 'native') not in ['native', 'python']:
+            print("target_type must be either 'native' or 'python'")
+            return False, conf_dict
+
+        # python targets are a 'file.py:function' callable that gets the input bytes, no arguments needed
+        required_keys = ['seeds_folder', 'output_folder', 'target']
+        if conf_dict.get('target_type', 'native') == 'native':
+            required_keys.append('target_args')
+        else:
+            conf_dict.setdefault('target_args', [])
+
+        for key in required_keys:
             if key not in conf_dict:
                 print(f'Error: {key} is missing in the config file')
                 return False, conf_dict
@@ -20,12 +32,54 @@ def parse_config(config_file, overwrite_output=True):
             print("Seeds folder is empty")
             return False, conf_dict
 
-        if not os.path.exists(conf_dict['target']):
+        if conf_dict.get('target_type', 'native') == 'python':
+            target_module = conf_dict['target'].rpartition(':')[0]
+            if ':' not in conf_dict['target'] or (target_module.endswith('.py') and not os.path.exists(target_module)):
+                print("Python target must be given as 'file.py:function' or 'module:function'")
+                return False, conf_dict
+
+            if conf_dict.get('python_isolation', 'fork') not in ['fork', 'inprocess']:
+                print("python_isolation must be either 'fork' or 'inprocess'")
+                return False, conf_dict
+
+            # coverage events are process-wide, the secondary worker threads would end up in the trace
+            if conf_dict.get('python_isolation', 'fork') == 'inprocess' and conf_dict.get('secondary_targets'):
+                print("secondary_targets need python_isolation = 'fork'")
+                return False, conf_dict
+
+        elif not os.path.exists(conf_dict['target']):
             print("Target does not exist")
             return False, conf_dict
 
+        if conf_dict.get('corpus_storage', 'files') not in ['files', 'segments']:
+            print("corpus_storage must be either 'files' or 'segments'")
+            return False, conf_dict
+
+        if conf_dict.get('power_schedule', 'default') not in POWER_SCHEDULES:
+            print(f"power_schedule must be one of {', '.join(POWER_SCHEDULES)}")
+            return False, conf_dict
+
+        if 'dictionary' in conf_dict and not os.path.exists(conf_dict['dictionary']):
+            print("Dictionary does not exist")
+            return False, conf_dict
+
+        cpu_affinity = conf_dict.get('cpu_affinity', 'auto')
+        if cpu_affinity not in ['auto', 'off'] and not isinstance(cpu_affinity, (int, list)):
+            print("cpu_affinity must be 'auto', 'off', a core number or a list of core numbers")
+            return False, conf_dict
+
+        for key in ['max_queue_size', 'distill_interval']:
+            if not isinstance(conf_dict.get(key, 0), int) or conf_dict.get(key, 0) < 0:
+                print(f"{key} must be a non-negative number")
+                return False, conf_dict
+
+        if 'sync_server' in conf_dict and not conf_dict['sync_server'].rpartition(':')[2].isdigit():
+            print("sync_server must be given as 'host:port'")
+            return False, conf_dict
+
         conf_dict['queue_folder'] = os.path.join(conf_dict['output_folder'], 'queue')
         conf_dict['crashes_folder'] = os.path.join(conf_dict['output_folder'], 'crashes')
+        conf_dict['edge_db_folder'] = os.path.join(conf_dict['output_folder'], 'edges')
 
         if overwrite_output and os.path.exists(conf_dict['output_folder']):
             print("Output folder already exists, overwriting it")
@@ -33,10 +87,29 @@ def parse_config(config_file, overwrite_output=True):
 
         if not os.path.exists(conf_dict['output_folder']):
             print("Output folder does not exist, creating it")
-            # queue folder is created during the dry run
+            # queue folder (or its segment store) is created during the dry run
             os.makedirs(conf_dict['output_folder'])
             os.makedirs(conf_dict['crashes_folder'])
 
+        # slower builds (e.g. ASan) that only run the inputs the main target promotes
+        names = set()
+        for sec_conf in conf_dict.get('secondary_targets', []):
+            for key in ['name', 'target', 'target_args']:
+                if key not in sec_conf:
+                    print(f'Error: {key} is missing in a secondary target')
+                    return False, conf_dict
+            if sec_conf['name'] in names:
+                print(f"Secondary target name {sec_conf['name']} is used twice")
+                return False, conf_dict
+            names.add(sec_conf['name'])
+            if not os.path.exists(sec_conf['target']):
+                print(f"Secondary target {sec_conf['target']} does not exist")
+                return False, conf_dict
+            sec_conf['corpus_storage'] = conf_dict.get('corpus_storage', 'files')
+            sec_conf['crashes_folder'] = os.path.join(conf_dict['output_folder'], f"crashes_{sec_conf['name']}")
+            sec_conf['current_input'] = os.path.join(conf_dict['output_folder'], f".cur_input_{sec_conf['name']}")
+            sec_conf['target_args'] = [sec_conf['current_input'] if x == '@@' else x for x in sec_conf['target_args']]
+
         conf_dict['current_input'] = os.path.join(conf_dict['output_folder'], '.cur_input')
         shutil.copyfile(os.path.join(conf_dict['seeds_folder'], os.listdir(conf_dict['seeds_folder'])[0]),
                         conf_dict['current_input'])
@@ -0,0 +1,120 @@
+import random
+import re
+
+
+# upper bound on the tokens kept, user-supplied tokens always fit
+MAX_TOKENS = 512
+# automatically extracted tokens are dropped once they were used this often without finding anything
+PRUNE_AFTER = 200
+
+MIN_TOKEN_LEN = 2
+MAX_TOKEN_LEN = 32
+
+# identifiers and keywords, short string literals and multi-character operators
+TOKEN_PATTERN = re.compile(
+    rb'[A-Za-z_$][A-Za-z0-9_$]{1,31}'
+    rb'|"[^"\\\n]{1,30}"|\'[^\'\\\n]{1,30}\''
+    rb'|===|!==|>>>=|>>>|<<=|>>=|\*\*=|\.\.\.|=>|==|!=|<=|>=|&&|\|\||\?\?|\+\+|--|<<|>>|\*\*|\+=|-=|\*=|/=|%=|&=|\|=|\^='
+)
+
+ESCAPE_PATTERN = re.compile(rb'\\(x[0-9A-Fa-f]{2}|\\|")')
+
+
+def _unescape(match):
+    escape = match.group(1)
+    if escape.startswith(b'x'):
+        return bytes([int(escape[1:], 16)])
+    return escape
+
+
+def parse_dictionary(path):
+    """Read an AFL dictionary: one name="value" or "value" per line, with \\xNN, \\\\ and \\" escapes."""
+    tokens = []
+    with open(path, 'rb') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith(b'#'):
+                continue
+            start = line.find(b'"')
+            if start == -1 or not line.endswith(b'"') or start == len(line) - 1:
+                print(f"Skipping malformed dictionary line {line_no}: {line.decode(errors='replace')}")
+                continue
+            token = ESCAPE_PATTERN.sub(_unescape, line[start + 1:-1])
+            if token:
+                tokens.append(token)
+    return tokens
+
+
+def extract_tokens(data):
+    """Candidate tokens of an input, most frequent first."""
+    counts = {}
+    for match in TOKEN_PATTERN.finditer(bytes(data)):
+        token = match.group()
+        counts[token] = counts.get(token, 0) + 1
+    return sorted(counts, key=counts.get, reverse=True)
+
+
+class TokenDictionary:
+    """The token table used by the token mutations, with per-token yield tracking."""
+
+    def __init__(self):
+        self.tokens = []
+        # [uses, finds, from the user's dictionary] per token, same order as tokens
+        self.stats = []
+        self.index = {}
+        # indices of the tokens used by the mutation currently being executed
+        self.used = []
+        # automatically extracted tokens that were pruned, they are not learned again
+        self.pruned = set()
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def clear(self):
+        self.tokens.clear()
+        self.stats.clear()
+        self.index.clear()
+        self.used.clear()
+        self.pruned.clear()
+
+    def add(self, token, user=False):
+        if token in self.index or (not user and (token in self.pruned or not MIN_TOKEN_LEN <= len(token) <= MAX_TOKEN_LEN)):
+            return False
+        if len(self.tokens) >= MAX_TOKENS and not user:
+            return False
+        self.index[token] = len(self.tokens)
+        self.tokens.append(token)
+        self.stats.append([0, 0, user])
+        return True
+
+    def learn(self, data):
+        """Add the tokens of an input that found something, returns how many were new."""
+        return sum(1 for token in extract_tokens(data) if self.add(token))
+
+    def pick(self):
+        i = random.randrange(len(self.tokens))
+        self.used.append(i)
+        return self.tokens[i]
+
+    def record_result(self, new_edge_covered):
+        for i in self.used:
+            self.stats[i][0] += 1
+            if new_edge_covered:
+                self.stats[i][1] += 1
+        for i in sorted(set(self.used), reverse=True):
+            uses, finds, user = self.stats[i]
+            if uses >= PRUNE_AFTER and finds == 0 and not user:
+                self._remove(i)
+        self.used.clear()
+
+    def _remove(self, i):
+        # swap with the last token, so the table stays dense and picking stays O(1)
+        del self.index[self.tokens[i]]
+        self.pruned.add(self.tokens[i])
+        last = len(self.tokens) - 1
+        if i != last:
+            self.tokens[i] = self.tokens[last]
+            self.stats[i] = self.stats[last]
+            self.index[self.tokens[i]] = i
+        self.tokens.pop()
+        self.stats.pop()
@@ -0,0 +1,33 @@
+def distill_queue(seed_queue):
+    """Split the queue into a minimal set of seeds that still covers every edge, and the rest.
+
+    Like AFL's cull_queue, each edge is credited to the fastest and smallest seed covering it,
+    then seeds are kept greedily until all edges are covered. Returns (kept, archived), both in
+    queue order.
+    """
+    top_rated = {}
+    for seed in seed_queue:
+        if seed.edges is None:
+            continue
+        cost = seed.exec_time * seed.file_size
+        for edge in seed.edges:
+            best = top_rated.get(edge)
+            if best is None or cost < best.exec_time * best.file_size:
+                top_rated[edge] = seed
+
+    chosen = set()
+    covered = set()
+    for edge, seed in top_rated.items():
+        if edge not in covered:
+            chosen.add(seed)
+            covered.update(seed.edges)
+
+    kept = []
+    archived = []
+    for seed in seed_queue:
+        # seeds without a recorded edge set can't be judged, so they stay
+        if seed in chosen or seed.edges is None:
+            kept.append(seed)
+        else:
+            archived.append(seed)
+    return kept, archived
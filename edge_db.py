@@ -0,0 +1,72 @@
+import struct
+from array import array
+from bisect import bisect_left
+from storage import SegmentStore
+
+
+# each record is this header followed by the sorted edge ids as array('H')
+# found_at is the number of seconds since the campaign started
+RECORD_HEADER = struct.Struct('<dQ')
+
+
+def has_edge(edges, edge):
+    # edge sets are sorted, so a binary search is enough
+    i = bisect_left(edges, edge)
+    return i < len(edges) and edges[i] == edge
+
+
+class EdgeDB:
+    """Per-seed edge sets, stored in a memory-mapped segment store in the output folder."""
+
+    def __init__(self, folder, read_only=False):
+        self.store = SegmentStore(folder, read_only=read_only)
+        # edge id -> index of the first record covering it, built on the first edge query
+        self.first_cover = None
+
+    def __len__(self):
+        return len(self.store)
+
+    def add(self, name, edges, found_at, execs):
+        self.store.add(RECORD_HEADER.pack(found_at, execs) + edges.tobytes(), name)
+        if self.first_cover is not None:
+            for edge in edges:
+                self.first_cover.setdefault(edge, len(self.store) - 1)
+
+    def record(self, index):
+        """Return (name, found_at, execs, edges) of the index-th queue entry."""
+        raw = self.store.read(index)
+        found_at, execs = RECORD_HEADER.unpack_from(raw)
+        edges = array('H')
+        edges.frombytes(raw[RECORD_HEADER.size:])
+        return self.store.entries[index][3], found_at, execs, edges
+
+    def records(self):
+        for i in range(len(self.store)):
+            yield self.record(i)
+
+    def find_seed(self, name):
+        for i, entry in enumerate(self.store.entries):
+            if entry[3] == name:
+                return self.record(i)
+        return None
+
+    def first_seed_for_edge(self, edge):
+        """Return the record of the queue entry that covered the edge first, or None."""
+        if self.first_cover is None:
+            self.first_cover = {}
+            for i, (_, _, _, edges) in enumerate(self.records()):
+                for e in edges:
+                    self.first_cover.setdefault(e, i)
+        index = self.first_cover.get(edge)
+        return None if index is None else self.record(index)
+
+    def seeds_for_edge(self, edge):
+        return [name for name, _, _, edges in self.records() if has_edge(edges, edge)]
+
+    def growth(self):
+        """Yield (name, found_at, execs, new_edges, total_edges) in the order entries were added."""
+        covered = set()
+        for name, found_at, execs, edges in self.records():
+            before = len(covered)
+            covered.update(edges)
+            yield name, found_at, execs, len(covered) - before, len(covered)
@@ -0,0 +1,66 @@
+import argparse
+import os
+from conf import *
+from edge_db import *
+
+
+def main():
+
+    print("====== Welcome to use Mini-Lop's Edge Query ======")
+
+    parser = argparse.ArgumentParser(description='answer coverage questions from the edge database, without running the target')
+
+    parser.add_argument('--config', '-c', required=True, help='Path to config file', type=str)
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = subparsers.add_parser('seed', help='list the edges covered by a queue entry')
+    seed_parser.add_argument('name', help='name of the queue entry', type=str)
+
+    edge_parser = subparsers.add_parser('edge', help='show which queue entries cover an edge')
+    edge_parser.add_argument('edge', help='edge id', type=int)
+
+    subparsers.add_parser('growth', help='show how coverage grew over the campaign')
+
+    args = parser.parse_args()
+
+    config_path = os.path.abspath(args.config)
+
+    config_valid, conf = parse_config(config_path, overwrite_output=False)
+
+    if not config_valid:
+        print("Config file is not valid")
+        return
+
+    if not os.path.exists(os.path.join(conf['edge_db_folder'], 'index')):
+        print("Edge database not found, has the fuzzer been run with this config?")
+        return
+
+    db = EdgeDB(conf['edge_db_folder'], read_only=True)
+
+    if args.command == 'seed':
+        record = db.find_seed(args.name)
+        if record is None:
+            print(f'Seed {args.name} is not in the edge database')
+            return
+        name, found_at, execs, edges = record
+        print(f'Seed {name} was added after {found_at:.2f}s and {execs} execs, it covers {len(edges)} edges:')
+        print(' '.join(str(edge) for edge in edges))
+
+    elif args.command == 'edge':
+        first = db.first_seed_for_edge(args.edge)
+        if first is None:
+            print(f'Edge {args.edge} has not been covered')
+            return
+        name, found_at, execs, _ = first
+        print(f'Edge {args.edge} was first covered by seed {name} after {found_at:.2f}s and {execs} execs')
+        print(f'Covered by: {" ".join(db.seeds_for_edge(args.edge))}')
+
+    elif args.command == 'growth':
+        print(f'{"seed":>12} {"time (s)":>10} {"execs":>10} {"new":>6} {"total":>6}')
+        for name, found_at, execs, new_edges, total_edges in db.growth():
+            print(f'{name:>12} {found_at:>10.2f} {execs:>10} {new_edges:>6} {total_edges:>6}')
+
+
+if __name__ == '__main__':
+    main()
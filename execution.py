@@ -2,7 +2,7 @@ import os
 import signal
 import threading
 import time
-from feedback import clear_shm
+from feedback import clear_shm, SHM_ENV_VAR
 import random
 
 # this is the timeout per execution in milliseconds
@@ -11,6 +11,35 @@ import random
 TIMEOUT = 10000
 TIMEOUT_SEC = float(TIMEOUT/10000)
 
+FORKSRV_FD = 198
+
+# like afl-fuzz, sanitizer reports abort the target so they show up as crashes
+# instead of a plain exit code, options already set by the user are kept
+SANITIZER_OPTIONS = {
+    'ASAN_OPTIONS': 'abort_on_error=1:detect_leaks=0:symbolize=0:allocator_may_return_null=1',
+    'UBSAN_OPTIONS': 'halt_on_error=1:abort_on_error=1:symbolize=0',
+    'MSAN_OPTIONS': 'exit_code=86:abort_on_error=1:symbolize=0',
+}
+
+
+def run_forkserver(conf, ctl_read_fd, st_write_fd):
+    os.dup2(ctl_read_fd, FORKSRV_FD)
+    os.dup2(st_write_fd, FORKSRV_FD + 1)
+    for name, options in SANITIZER_OPTIONS.items():
+        os.environ.setdefault(name, options)
+    # prepare command
+    cmd = [conf['target']] + conf['target_args']
+    print(cmd)
+    print(f'shmid is {os.environ[SHM_ENV_VAR]}')
+    print(f'st_write_fd: {st_write_fd}')
+
+    # eats stdout and stderr of the target
+    dev_null_fd = os.open(os.devnull, os.O_RDWR)
+    os.dup2(dev_null_fd, 1)
+    os.dup2(dev_null_fd, 2)
+
+    os.execv(conf['target'], cmd)
+
 
 def monitor_timeout(grandchild_pid):
     """Thread function to monitor if the status byte is read within the timeout period."""
@@ -59,3 +88,36 @@ def run_target(ctl_write_fd, st_read_fd, trace_bits):
 
 
     return status_code, exec_time
+
+
+class ForkserverTarget:
+    """Runs inputs through the AFL forkserver of a native target."""
+
+    def __init__(self, ctl_write_fd, st_read_fd, trace_bits, forkserver_pid=None):
+        self.ctl_write_fd = ctl_write_fd
+        self.st_read_fd = st_read_fd
+        self.trace_bits = trace_bits
+        self.forkserver_pid = forkserver_pid
+        # native crashes are only told apart by their status code
+        self.last_crash_bucket = None
+
+    def wait_ready(self):
+        # the forkserver says hello with 4 bytes once it is up
+        read_bytes = os.read(self.st_read_fd, 4)
+        return len(read_bytes) == 4
+
+    def run(self):
+        status_code, exec_time = run_target(self.ctl_write_fd, self.st_read_fd, self.trace_bits)
+        self.last_crash_bucket = f'sig{status_code}'
+        return status_code, exec_time
+
+    def close(self):
+        if self.forkserver_pid is not None:
+            try:
+                os.kill(self.forkserver_pid, signal.SIGKILL)
+            except OSError:
+                pass
+            os.waitpid(self.forkserver_pid, 0)
+            self.forkserver_pid = None
+        os.close(self.ctl_write_fd)
+        os.close(self.st_read_fd)
@@ -1,5 +1,6 @@
 import argparse
 import signal
+import socket
 from conf import *
 from libc import *
 from feedback import *
@@ -7,9 +8,41 @@ from execution import *
 from seed import *
 from schedule import *
 from mutation import *
-
-
-FORKSRV_FD = 198
+from storage import *
+from edge_db import *
+from python_executor import PythonTarget
+from benchmark import *
+from dictionary import parse_dictionary
+from affinity import bind_to_core
+from distill import distill_queue
+from sync import SyncClient
+from secondary import start_secondary_targets
+
+
+# print a status line every this many executions
+STATS_INTERVAL = 5000
+
+# benchmark runs time seeds by the edges they hit instead of the wall clock, so that
+# the schedule (and with it the whole run) only depends on the RNG seed
+DETERMINISTIC_SEC_PER_EDGE = 0.000001
+# recipes from the recipe book replayed on a seed each time it is picked
+REPLAY_FAVORED = 8
+REPLAY_OTHER = 2
+
+
+def print_stats(conf, total_execs, start_time, seed_queue, archive, global_bitmap, initial_edges, path_cache, secondaries):
+    elapsed = time.time() - start_time
+    yields = ' '.join(f'{name}: {finds}/{execs}' for name, (execs, finds) in mutation_stats.items())
+    # edges found per million execs is what the power schedules are compared by
+    edges_per_mexec = (len(global_bitmap) - initial_edges) * 1000000 / total_execs
+    print(f'execs: {total_execs} ({total_execs / elapsed:.0f}/s) | queue: {len(seed_queue)} (+{len(archive)} archived) | '
+          f'edges: {len(global_bitmap)} ({edges_per_mexec:.0f}/M execs, {conf.get("power_schedule", "default")})')
+    print(f'  finds/execs {yields}')
+    print(f'  recipes: {len(recipe_book)} ({recipe_book.replay_finds()} replay finds) | '
+          f'tokens: {len(token_dictionary)} ({len(token_dictionary.pruned)} pruned)')
+    print(f'  path cache: {path_cache.hit_rate():.0%} hits, {path_cache.time_saved():.1f}s saved')
+    for secondary in secondaries:
+        print(f'  secondary {secondary.status()}')
 
 
 # listen for user's signal
@@ -18,39 +51,101 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
-def run_forkserver(conf, ctl_read_fd, st_write_fd):
-    os.dup2(ctl_read_fd, FORKSRV_FD)
-    os.dup2(st_write_fd, FORKSRV_FD + 1)
-    # prepare command
-    cmd = [conf['target']] + conf['target_args']
-    print(cmd)
-    print(f'shmid is {os.environ[SHM_ENV_VAR]}')
-    print(f'st_write_fd: {st_write_fd}')
+def run_fuzzing(conf, target, trace_bits, exec_budget=None, deterministic=False, secondaries=()):
 
-    # eats stdout and stderr of the target
-    dev_null_fd = os.open(os.devnull, os.O_RDWR)
-    os.dup2(dev_null_fd, 1)
-    os.dup2(dev_null_fd, 2)
+    if target.wait_ready():
+        print("target is up! starting fuzzing... press Ctrl+C to stop")
 
-    os.execv(conf['target'], cmd)
+    seed_queue = []
+    # seeds retired by distillation, never scheduled again but still used as splice partners
+    archive = []
+    global_bitmap = {}
+    queue_store = open_store(conf, 'queue')
+    crash_store = open_store(conf, 'crashes')
+    path_cache = PathCache()
+    # checksums of the crashing paths seen so far, a crash on a known path is not saved again
+    crash_checksums = set()
+    edge_db = EdgeDB(conf['edge_db_folder'])
+    start_time = time.time()
+    total_execs = 0
+    if 'dictionary' in conf:
+        for token in parse_dictionary(conf['dictionary']):
+            token_dictionary.add(token, user=True)
+        print(f"Loaded {len(token_dictionary)} tokens from {conf['dictionary']}")
+    # learn tokens from the seeds and from every input that finds new coverage
+    auto_dictionary = conf.get('auto_dictionary', True)
+    # the per-seed path counts are only kept when the entropic schedule reads them
+    track_species = conf.get('power_schedule', 'default') == 'entropic'
+
+    # new queue entries waiting to be pushed to the sync server, as (data, edges)
+    sync_outbox = []
+
+    def add_seed(data, name, seed_id, checksum, coverage, exec_time, edges):
+        seed_path = queue_store.add(data, name)
+        if auto_dictionary:
+            token_dictionary.learn(data)
+
+        edge_db.add(name, edges, time.time() - start_time, total_execs)
+        if 'sync_server' in conf:
+            sync_outbox.append((data, edges))
+        for secondary in secondaries:
+            secondary.submit('queue', data)
+
+        if deterministic:
+            exec_time = coverage * DETERMINISTIC_SEC_PER_EDGE
+        new_seed = Seed(seed_path, seed_id, coverage, exec_time, len(data), edges)
+        new_seed.path_checksum = checksum
 
+        seed_queue.append(new_seed)
+        splice_partners.add(new_seed)
+        return new_seed
+
+    def run_mutant(selected_seed):
+        """Run the mutated input in current_input and keep it if it crashes or finds new edges."""
+        nonlocal total_execs
+        # run the target with the mutated seed
+        status_code, exec_time = target.run()
+        total_execs += 1
+        if total_execs % STATS_INTERVAL == 0:
+            print_stats(conf, total_execs, start_time, seed_queue, archive, global_bitmap, initial_edges, path_cache, secondaries)
 
-def run_fuzzing(conf, st_read_fd, ctl_write_fd, trace_bits):
+        if status_code == 9:
+            print("Timeout, skipping this input")
+            return
 
-    read_bytes = os.read(st_read_fd, 4)
-    if len(read_bytes) == 4:
-        print("forkserver is up! starting fuzzing... press Ctrl+C to stop")
+        if check_crash(status_code):
+            print(f"Found a crash, status code is {status_code}")
+            checksum = trace_checksum(trace_bits)
+            if checksum not in crash_checksums:
+                crash_checksums.add(checksum)
+                with open(conf['current_input'], 'rb') as f:
+                    data = f.read()
+                crash_store.add(data, f'{len(crash_store)}_{target.last_crash_bucket}_{checksum:016x}')
+                for secondary in secondaries:
+                    secondary.submit('crash', data)
+
+            return
+
+        checksum, new_edge_covered, coverage, edges = path_cache.check_coverage(trace_bits, global_bitmap)
+        record_mutation_result(new_edge_covered)
+        if new_edge_covered:
+            timeline.append((total_execs, time.time() - start_time, len(global_bitmap)))
+        record_execution(selected_seed, checksum, track_species)
+
+        # coverage is the total hits
+        if new_edge_covered:
+            # print("Found new coverage!")
+            with open(conf['current_input'], 'rb') as f:
+                add_seed(f.read(), str(len(queue_store)), len(queue_store), checksum, coverage, exec_time, edges)
 
-    seed_queue = []
-    global_bitmap = {}
     # do the dry run, check if the target is working and initialize the seed queue
-    shutil.copytree(conf['seeds_folder'], conf['queue_folder'])
-    for i, seed_file in enumerate(os.listdir(conf['queue_folder'])):
-        seed_path = os.path.join(conf['queue_folder'], seed_file)
+    # sorted, so runs with the same RNG seed see the seeds in the same order
+    for i, seed_file in enumerate(sorted(os.listdir(conf['seeds_folder']))):
         # copy the seed content to "current_input"
-        shutil.copyfile(seed_path, conf['current_input'])
+        shutil.copyfile(os.path.join(conf['seeds_folder'], seed_file), conf['current_input'])
         # run the target with the seed
-        status_code, exec_time = run_target(ctl_write_fd, st_read_fd, trace_bits)
+        status_code, exec_time = target.run()
+        total_execs += 1
 
         if status_code == 9:
             print(f"Seed {seed_file} caused a timeout during the dry run")
@@ -60,60 +155,96 @@ def run_fuzzing(conf, st_read_fd, ctl_write_fd, trace_bits):
             print(f"Seed {seed_file} caused a crash during the dry run")
             sys.exit(0)
 
-        new_edge_covered, coverage = check_coverage(trace_bits, global_bitmap)
-        file_size = os.path.getsize(conf['current_input'])
+        checksum, new_edge_covered, coverage, edges = path_cache.check_coverage(trace_bits, global_bitmap)
+        if checksum in (s.path_checksum for s in seed_queue):
+            print(f"Seed {seed_file} takes the same path as an earlier seed")
 
-        new_seed = Seed(seed_path, i, coverage, exec_time, file_size)
-
-        seed_queue.append(new_seed)
+        with open(conf['current_input'], 'rb') as f:
+            add_seed(f.read(), seed_file, i, checksum, coverage, exec_time, edges)
 
+    initial_edges = len(global_bitmap)
+    print(f"Token dictionary has {len(token_dictionary)} tokens")
+    # (execs, seconds, edges) every time coverage grows
+    timeline = [(total_execs, time.time() - start_time, initial_edges)]
     print("Dry run finished. Now starting the fuzzing loop...")
     # start the fuzzing loop
-    while True:
+    max_queue_size = conf.get('max_queue_size', 0)
+    distill_interval = conf.get('distill_interval', 0)
+    next_distill_size = max_queue_size
+    last_distill_execs = total_execs
+    sync_client = None
+    if 'sync_server' in conf:
+        sync_client = SyncClient(conf['sync_server'], conf.get('sync_node', f'{socket.gethostname()}-{os.getpid()}'))
+    sync_interval = conf.get('sync_interval', 60)
+    last_sync = time.time()
+    while exec_budget is None or total_execs < exec_budget:
+        if sync_client is not None and time.time() - last_sync >= sync_interval:
+            pushed = 0
+            try:
+                pushed = sync_client.push(sync_outbox)
+                sync_outbox.clear()
+                imported = sync_client.pull(global_bitmap)
+            except OSError as e:
+                print(f"Sync with {conf['sync_server']} failed: {e}")
+                imported = []
+
+            # like AFL's sync, imported inputs are run here and only kept if they add coverage locally
+            found = 0
+            for data, _ in imported:
+                with open(conf['current_input'], 'wb') as f:
+                    f.write(data)
+                status_code, exec_time = target.run()
+                total_execs += 1
+                if status_code == 9 or check_crash(status_code):
+                    continue
+                checksum, new_edge_covered, coverage, edges = path_cache.check_coverage(trace_bits, global_bitmap)
+                if new_edge_covered:
+                    add_seed(data, str(len(queue_store)), len(queue_store), checksum, coverage, exec_time, edges)
+                    found += 1
+            last_sync = time.time()
+            print(f"Synced with {conf['sync_server']}: pushed {pushed} new entries, imported {found} of {len(imported)}")
+
+        if (max_queue_size and len(seed_queue) > next_distill_size) or \
+                (distill_interval and total_execs - last_distill_execs >= distill_interval):
+            kept, archived = distill_queue(seed_queue)
+            if archived:
+                keep_cycle_position(seed_queue, kept)
+                seed_queue[:] = kept
+                archive.extend(archived)
+            # don't distill again until the queue has grown by a tenth
+            next_distill_size = max(max_queue_size, len(seed_queue) + len(seed_queue) // 10)
+            last_distill_execs = total_execs
+            print(f"Distilled the queue to {len(seed_queue)} seeds, archived {len(archived)}")
+
         selected_seed = select_next_seed(seed_queue, len(global_bitmap))
 
         stats = calculate_statistics(seed_queue)
-        power_schedule = get_power_schedule(selected_seed, *stats)
+        power_schedule = get_scheduled_power(conf.get('power_schedule', 'default'), selected_seed,
+                                             seed_queue, global_bitmap, stats)
         # print(global_bitmap)
         # print(f"Power schedule: {power_schedule}")
 
+        # replay the best recipes found on other seeds before the random havoc
+        # never more than the havoc stage gets, seeds the schedule gives little energy stay cheap
+        replays = min(REPLAY_FAVORED if selected_seed.favored else REPLAY_OTHER, power_schedule)
+        for recipe in recipe_book.best(selected_seed, replays):
+            if exec_budget is not None and total_execs >= exec_budget:
+                break
+            replay_recipe(conf, selected_seed, recipe)
+            run_mutant(selected_seed)
+
         # generate new test inputs according to the power schedule for the selected seed
         for i in range(0, power_schedule):
+            if exec_budget is not None and total_execs >= exec_budget:
+                break
             # TODO: implement the strategy for selecting a mutation operator
             havoc_mutation(conf, selected_seed, seed_queue)
-            # run the target with the mutated seed
-            status_code, exec_time = run_target(ctl_write_fd, st_read_fd, trace_bits)
-
-            if status_code == 9:
-                print("Timeout, skipping this input")
-                continue
-
-            if check_crash(status_code):
-                print(f"Found a crash, status code is {status_code}")
-                filename = str(len(os.listdir(conf['crashes_folder'])))
-                crash_path = os.path.join(conf['crashes_folder'], filename)
-
-                # Make the file name and path
-                shutil.copyfile(conf['current_input'], crash_path)
-
-                continue
-
-            new_edge_covered, coverage = check_coverage(trace_bits, global_bitmap)
+            run_mutant(selected_seed)
 
-            # coverage is the total hits
-            if new_edge_covered:
-                # print("Found new coverage!")
-                filename = str(len(os.listdir(conf['queue_folder'])))
-                queue_path = os.path.join(conf['queue_folder'], filename)
+        selected_seed.fuzz_level += 1
 
-                # Make the file name and path
-                shutil.copyfile(conf['current_input'], queue_path)
-                file_size = os.path.getsize(conf['current_input'])
-
-                new_seed = Seed(queue_path, filename, coverage, exec_time, file_size)
-                seed_queue.append(new_seed)
-
-                continue
+    timeline.append((total_execs, time.time() - start_time, len(global_bitmap)))
+    return timeline
 
 
 def main():
@@ -123,6 +254,11 @@ def main():
     parser = argparse.ArgumentParser(description='Mini-Lop: A lightweight grey-box fuzzer')
 
     parser.add_argument('--config', '-c', required=True, help='Path to config file', type=str)
+    parser.add_argument('--benchmark', action='store_true', help='Run a reproducible coverage benchmark instead of fuzzing forever')
+    parser.add_argument('--rng-seed', default=0, help='Benchmark: seed of the random number generator', type=int)
+    parser.add_argument('--exec-budget', default=20000, help='Benchmark: number of executions per run', type=int)
+    parser.add_argument('--repeats', default=5, help='Benchmark: number of runs', type=int)
+    parser.add_argument('--bench-output', default='bench_output.json', help='Benchmark: where to write the JSON results', type=str)
 
     args = parser.parse_args()
 
@@ -144,6 +280,46 @@ def main():
 
     signal.signal(signal.SIGINT, signal_handler)
 
+    # done before the forkserver is started, so it and every target execution inherit the core
+    bind_to_core(conf)
+
+    if not args.benchmark:
+        target = start_target(conf, trace_bits)
+        if target is not None:
+            secondaries = start_secondary_targets(conf, libc)
+            run_fuzzing(conf, target, trace_bits, secondaries=secondaries)
+        return
+
+    runs = []
+    for repeat in range(args.repeats):
+        print(f"Benchmark run {repeat + 1}/{args.repeats}, rng seed {args.rng_seed + repeat}")
+        if repeat > 0:
+            # start every repeat from an empty output folder
+            config_valid, conf = parse_config(config_path)
+        random.seed(args.rng_seed + repeat)
+        reset_schedule_state()
+        reset_mutation_state()
+
+        target = start_target(conf, trace_bits)
+        if target is None:
+            return
+        secondaries = start_secondary_targets(conf, libc)
+        timeline = run_fuzzing(conf, target, trace_bits, args.exec_budget, deterministic=True, secondaries=secondaries)
+        target.close()
+        for secondary in secondaries:
+            secondary.close()
+        runs.append({'rng_seed': args.rng_seed + repeat, 'timeline': timeline})
+
+    report = write_report(args.bench_output, conf, args.rng_seed, args.exec_budget, runs)
+    print_summary(report)
+    print(f"Benchmark results written to {args.bench_output}")
+
+
+def start_target(conf, trace_bits):
+    """Start the target, returns None in the forkserver child."""
+    if conf.get('target_type', 'native') == 'python':
+        return PythonTarget(conf, trace_bits)
+
     # setup pipes for communication
     # st: status, ctl: control
     (st_read_fd, st_write_fd) = os.pipe()
@@ -153,9 +329,11 @@ def main():
 
     if child_pid == 0:
         run_forkserver(conf, ctl_read_fd, st_write_fd)
-    else:
-        run_fuzzing(conf, st_read_fd, ctl_write_fd, trace_bits)
+        return None
 
+    os.close(ctl_read_fd)
+    os.close(st_write_fd)
+    return ForkserverTarget(ctl_write_fd, st_read_fd, trace_bits, child_pid)
 
 if __name__ == '__main__':
     main()
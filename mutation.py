@@ -1,43 +1,200 @@
 import random
 import struct
-import os
+from storage import read_input
+from dictionary import TokenDictionary
+
+# how many partners to try before giving up on a splice
+SPLICE_ATTEMPTS = 4
+# partners sampled for each splice, one of them is picked by its weight
+SPLICE_CANDIDATES = 8
+# upper bound on the recipes kept, the worst scoring one makes room for a new one
+MAX_RECIPES = 256
+
+
+def locate_diffs(data1, data2):
+    """Return the first and last differing byte of the two inputs, as AFL does, or (-1, -1) if they don't differ."""
+    length = min(len(data1), len(data2))
+    first = next((i for i in range(length) if data1[i] != data2[i]), -1)
+    if first == -1:
+        return -1, -1
+    last = next(i for i in range(length - 1, first - 1, -1) if data1[i] != data2[i])
+    return first, last
+
+
+def splice_buffers(data1, data2):
+    # cutting outside the differing region would just reproduce one of the inputs
+    first, last = locate_diffs(data1, data2)
+    if first < 0 or last < 2 or first == last:
+        return None
+    split = random.randint(first, last - 1) if last - first > 1 else first
+    return data1[:split] + data2[split:]
+
+
+class SplicePartnerIndex:
+    """Seeds that can be spliced, partners are weighted by how many edges they cover that the seed does not."""
+
+    def __init__(self):
+        self.seeds = []
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def clear(self):
+        self.seeds.clear()
+
+    def add(self, seed):
+        if seed.file_size >= 2:
+            self.seeds.append(seed)
+
+    def pick(self, seed, own_edges):
+        if len(self.seeds) < 2:
+            return None
+        # score a small sample on demand, nothing per seed is kept as the queue grows
+        candidates = [partner for partner in random.sample(self.seeds, min(SPLICE_CANDIDATES, len(self.seeds)))
+                      if partner is not seed]
+        if not candidates:
+            return None
+        weights = [1 if partner.edges is None else 1 + len(partner.edges) - len(own_edges.intersection(partner.edges))
+                   for partner in candidates]
+        return random.choices(candidates, weights=weights)[0]
+
+    def splice(self, seed, data):
+        own_edges = set(seed.edges) if seed.edges is not None else set()
+        for _ in range(SPLICE_ATTEMPTS):
+            partner = self.pick(seed, own_edges)
+            if partner is None:
+                continue
+            try:
+                spliced = splice_buffers(data, bytearray(read_input(partner.path)))
+            except (IOError, OSError):
+                continue
+            if spliced is not None:
+                return spliced
+        return None
+
+
+class RecipeBook:
+    """Mutation recipes that found new coverage, ranked by how well they do when replayed on other seeds."""
+
+    def __init__(self, max_recipes=MAX_RECIPES):
+        self.max_recipes = max_recipes
+        # recipe -> [seed_id it was found on, finds, replays, replay finds]
+        self.recipes = {}
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def clear(self):
+        self.recipes.clear()
+        self.evicted = 0
+
+    def score(self, recipe):
+        _, finds, replays, replay_finds = self.recipes[recipe]
+        # an untried recipe starts at 1/2, one that keeps failing on other seeds sinks below the new ones
+        return (replay_finds + finds) / (replays + finds + 1)
+
+    def add(self, recipe, seed_id):
+        if recipe in self.recipes:
+            self.recipes[recipe][1] += 1
+            return
+        if len(self.recipes) >= self.max_recipes:
+            del self.recipes[min(self.recipes, key=self.score)]
+            self.evicted += 1
+        self.recipes[recipe] = [seed_id, 1, 0, 0]
+
+    def record_replay(self, recipe, new_edge_covered):
+        stats = self.recipes.get(recipe)
+        if stats is None:
+            return
+        stats[2] += 1
+        if new_edge_covered:
+            stats[3] += 1
+
+    def best(self, seed, n):
+        """The n best recipes that were neither found on nor replayed on the seed yet."""
+        candidates = [recipe for recipe, stats in self.recipes.items()
+                      if stats[0] != seed.seed_id and recipe not in seed.replayed]
+        candidates.sort(key=self.score, reverse=True)
+        return candidates[:n]
+
+    def replay_finds(self):
+        return sum(stats[3] for stats in self.recipes.values())
+
+
+# filled by the fuzzing loop as seeds are added to the queue
+splice_partners = SplicePartnerIndex()
+
+# tokens from the user's dictionary and the ones learned from the corpus
+token_dictionary = TokenDictionary()
+
+# recipes of the mutations that found new coverage, replayed on other seeds before their havoc stage
+recipe_book = RecipeBook()
+
+# [execs, finds] per mutation strategy, so splice yield can be told apart from havoc
+mutation_stats = {'deterministic': [0, 0], 'splice': [0, 0], 'havoc': [0, 0], 'replay': [0, 0]}
+last_strategy = None
+last_seed_id = None
+# (operator, params) steps of the mutation being executed, None if it can't be replayed
+current_recipe = None
+
+
+def reset_mutation_state():
+    global last_strategy, last_seed_id, current_recipe
+    splice_partners.clear()
+    token_dictionary.clear()
+    recipe_book.clear()
+    for counts in mutation_stats.values():
+        counts[0] = counts[1] = 0
+    last_strategy = None
+    last_seed_id = None
+    current_recipe = None
+
+
+def record_step(operator, params):
+    if current_recipe is not None:
+        current_recipe.append((operator, params))
+
+
+def discard_recipe():
+    global current_recipe
+    current_recipe = None
+
+
+def record_mutation_result(new_edge_covered):
+    if last_strategy is None:
+        return
+    mutation_stats[last_strategy][0] += 1
+    if new_edge_covered:
+        mutation_stats[last_strategy][1] += 1
+    token_dictionary.record_result(new_edge_covered)
+    if last_strategy == 'replay':
+        recipe_book.record_replay(current_recipe, new_edge_covered)
+    elif new_edge_covered and current_recipe:
+        recipe_book.add(tuple(current_recipe), last_seed_id)
+
 
 class SpliceMutator:
     def __init__(self, havoc_mutator=None):
         self.havoc_mutator = havoc_mutator or HavocMutator()
         
     def mutate(self, seed, queue, conf):
-        # Get list of other valid seeds (excluding current seed)
-        other_seeds = [s for s in queue if s.path != seed.path and os.path.exists(s.path)]
-        if not other_seeds:
-            return None
-            
         # Read current seed data
         try:
-            with open(seed.path, 'rb') as f:
-                data1 = bytearray(f.read())
+            data1 = bytearray(read_input(seed.path))
         except (IOError, OSError):
             return None
             
         if len(data1) < 2:  # Need at least 2 bytes to splice
             return None
             
-        # Choose just one other seed randomly
-        other_seed = random.choice(other_seeds)
+        # Cut somewhere between the first and last byte where the inputs differ
+        spliced_data = splice_partners.splice(seed, data1)
+        if spliced_data is None:
+            return None
+        discard_recipe()
+
         try:
-            with open(other_seed.path, 'rb') as f:
-                data2 = bytearray(f.read())
-                
-            if len(data2) < 2:
-                return None
-                
-            # Split both files at their midpoints
-            split1 = len(data1) // 2
-            split2 = len(data2) // 2
-            
-            # Create new test input by combining first half of data1 with second half of data2
-            spliced_data = data1[:split1] + data2[split2:]
-            
             # Write spliced data to temporary file for havoc mutation
             with open(conf['current_input'], 'wb') as f:
                 f.write(spliced_data)
@@ -63,8 +220,7 @@ class DeterministicMutator:
         self.min_ratio = 0.05
 
     def mutate(self, conf, seed, queue=None, mutation_type=None):
-        with open(seed.path, 'rb') as f:
-            data = bytearray(f.read())
+        data = bytearray(read_input(seed.path))
             
         if not data:
             return None
@@ -90,55 +246,80 @@ class DeterministicMutator:
                 data = self._single_chunk_replacement(data)
             elif mutation == 'duplicate_chunk':
                 data = self._single_chunk_duplicate(data)
-            elif mutation == 'splice' and queue:
-                spliced = self._splice_mutation(data, seed, queue)
+            elif mutation == 'token_insert' and token_dictionary:
+                data = self._token_insert(data)
+            elif mutation == 'token_overwrite' and token_dictionary:
+                data = self._token_overwrite(data)
+            elif mutation == 'splice':
+                spliced = self._splice_mutation(data, seed, queue) if queue else None
                 if spliced:
                     data = spliced
+                elif mutation_type == 'splice':
+                    mutations.append(self.fallback_mutation())
 
         with open(conf['current_input'], 'wb') as f:
             f.write(data)
             
         return data
 
-    def _single_bit_flip(self, data):
+    def _single_bit_flip(self, data, params=None):
         if not data:
             return data
-        pos = random.randint(0, len(data) - 1)
-        bit = random.randint(0, 7)
+        if params is None:
+            pos = random.randint(0, len(data) - 1)
+            bit = random.randint(0, 7)
+        else:
+            pos, bit = params
+            pos = min(pos, len(data) - 1)
         data[pos] ^= (1 << bit)
+        record_step('bit_flip', (pos, bit))
         return data
 
-    def _single_byte_flip(self, data):
+    def _single_byte_flip(self, data, params=None):
         if not data:
             return data
-        size = random.choice([1, 2, 4])
-        if len(data) < size:
-            size = len(data)
-        pos = random.randint(0, len(data) - size)
+        if params is None:
+            size = random.choice([1, 2, 4])
+            if len(data) < size:
+                size = len(data)
+            pos = random.randint(0, len(data) - size)
+        else:
+            pos, size = params
+            size = min(size, len(data))
+            pos = min(pos, len(data) - size)
         for i in range(size):
             data[pos + i] ^= 0xFF
+        record_step('byte_flip', (pos, size))
         return data
 
-    def _single_arithmetic(self, data):
+    def _single_arithmetic(self, data, params=None):
         if len(data) < 2:
             return data
         sizes = [(2, 'h'), (4, 'i'), (8, 'q')]
-        size, fmt = random.choice(sizes)
+        if params is None:
+            size, fmt = random.choice(sizes)
+        else:
+            pos, size, delta = params
+            fmt = dict(sizes)[size]
         if len(data) < size:
             return data
         
-        pos = random.randint(0, len(data) - size)
+        if params is None:
+            pos = random.randint(0, len(data) - size)
+            delta = random.randint(-35, 35)
+        else:
+            pos = min(pos, len(data) - size)
         try:
             value = struct.unpack('<' + fmt, data[pos:pos + size])[0]
-            delta = random.randint(-35, 35)
             if delta != 0:
                 new_value = value + delta
                 data[pos:pos + size] = struct.pack('<' + fmt, new_value)
+                record_step('arithmetic', (pos, size, delta))
         except struct.error:
             pass
         return data
 
-    def _single_interesting_value(self, data):
+    def _single_interesting_value(self, data, params=None):
         if not data:
             return data
         interesting_sets = [
@@ -146,12 +327,18 @@ class DeterministicMutator:
             (2, self.INTERESTING_16),
             (4, self.INTERESTING_32)
         ]
-        size, values = random.choice(interesting_sets)
+        if params is None:
+            size, values = random.choice(interesting_sets)
+        else:
+            pos, size, value = params
         if len(data) < size:
             return data
             
-        pos = random.randint(0, len(data) - size)
-        value = random.choice(values)
+        if params is None:
+            pos = random.randint(0, len(data) - size)
+            value = random.choice(values)
+        else:
+            pos = min(pos, len(data) - size)
         try:
             if size == 1:
                 data[pos] = value & 0xFF
@@ -159,76 +346,139 @@ class DeterministicMutator:
                 data[pos:pos + 2] = struct.pack('<h', value)
             elif size == 4:
                 data[pos:pos + 4] = struct.pack('<i', value)
+            record_step('interesting_value', (pos, size, value))
         except struct.error:
             pass
         return data
 
-    def _single_chunk_replacement(self, data):
+    def _single_chunk_replacement(self, data, params=None):
         if len(data) < 4:
             return data
-        chunk_size = random.choice([2, 4, 8])
+        if params is None:
+            chunk_size = random.choice([2, 4, 8])
+        else:
+            pos1, pos2, chunk_size = params
         if len(data) < chunk_size * 2:
             return data
             
-        pos1 = random.randint(0, len(data) - chunk_size)
-        pos2 = random.randint(0, len(data) - chunk_size)
+        if params is None:
+            pos1 = random.randint(0, len(data) - chunk_size)
+            pos2 = random.randint(0, len(data) - chunk_size)
+        else:
+            pos1 = min(pos1, len(data) - chunk_size)
+            pos2 = min(pos2, len(data) - chunk_size)
         
         chunk1 = data[pos1:pos1 + chunk_size]
         chunk2 = data[pos2:pos2 + chunk_size]
         data[pos1:pos1 + chunk_size] = chunk2
         data[pos2:pos2 + chunk_size] = chunk1
+        record_step('chunk_replacement', (pos1, pos2, chunk_size))
         return data
 
-    def _single_chunk_duplicate(self, data):
+    def _single_chunk_duplicate(self, data, params=None):
         if len(data) < 2:
             return data
-        chunk_size = random.choice([1, 2, 4, 8])
+        if params is None:
+            chunk_size = random.choice([1, 2, 4, 8])
+        else:
+            src_pos, dst_pos, chunk_size = params
         if len(data) < chunk_size:
             return data
             
-        src_pos = random.randint(0, len(data) - chunk_size)
-        dst_pos = random.randint(0, len(data))
+        if params is None:
+            src_pos = random.randint(0, len(data) - chunk_size)
+            dst_pos = random.randint(0, len(data))
+        else:
+            src_pos = min(src_pos, len(data) - chunk_size)
+            dst_pos = min(dst_pos, len(data))
         
         chunk = data[src_pos:src_pos + chunk_size]
         data[dst_pos:dst_pos] = chunk
+        record_step('duplicate_chunk', (src_pos, dst_pos, chunk_size))
         return data
 
-    def _flip_mutation(self, data):
+    def _token_insert(self, data, params=None):
+        if params is None:
+            token = token_dictionary.pick()
+            pos = random.randint(0, len(data))
+        else:
+            pos, token = params
+            pos = min(pos, len(data))
+        data[pos:pos] = token
+        record_step('token_insert', (pos, token))
+        return data
+
+    def _token_overwrite(self, data, params=None):
+        if params is None:
+            token = token_dictionary.pick()
+        else:
+            pos, token = params
+        if len(data) < len(token):
+            return data
+        if params is None:
+            pos = random.randint(0, len(data) - len(token))
+        else:
+            pos = min(pos, len(data) - len(token))
+        data[pos:pos + len(token)] = token
+        record_step('token_overwrite', (pos, token))
+        return data
+
+    def _flip_mutation(self, data, params=None):
         if len(data) < 4:
             return data
         
-        chunk_size = random.choice([1, 2, 4, 8, 16, 32, 64, 128])
+        if params is None:
+            chunk_size = random.choice([1, 2, 4, 8, 16, 32, 64, 128])
+        else:
+            pos, chunk_size = params
         if len(data) < chunk_size * 2:
             return data
             
-        pos = random.randint(0, len(data) - chunk_size)
+        if params is None:
+            pos = random.randint(0, len(data) - chunk_size)
+        else:
+            pos = min(pos, len(data) - chunk_size)
         if len(data) - chunk_size < len(data) * self.min_ratio:
             return data
             
+        record_step('flip', (pos, chunk_size))
         return data[:pos] + data[pos + chunk_size:]
 
+    def replay(self, data, recipe):
+        """Apply a recorded recipe to other data, positions that don't fit are clamped."""
+        operators = {
+            'flip': self._flip_mutation,
+            'bit_flip': self._single_bit_flip,
+            'byte_flip': self._single_byte_flip,
+            'arithmetic': self._single_arithmetic,
+            'interesting_value': self._single_interesting_value,
+            'chunk_replacement': self._single_chunk_replacement,
+            'duplicate_chunk': self._single_chunk_duplicate,
+            'token_insert': self._token_insert,
+            'token_overwrite': self._token_overwrite,
+        }
+        for operator, params in recipe:
+            if not data:
+                break
+            data = operators[operator](data, params)
+        return data
+
     def _splice_mutation(self, data, seed, queue):
         if len(data) < 2:
             return None
-            
-        other_seeds = [s for s in queue if s.path != seed.path and os.path.exists(s.path)]
-        if not other_seeds:
-            return None
-            
-        other_seed = random.choice(other_seeds)
-        try:
-            with open(other_seed.path, 'rb') as f:
-                other_data = bytearray(f.read())
-                
-            if len(other_data) < 2:
-                return None
-                
-            curr_split = random.randint(1, len(data) - 1)
-            other_split = random.randint(1, len(other_data) - 1)
-            
-            return data[:curr_split] + other_data[other_split:]
-        except (IOError, OSError):
-            return None
+        spliced = splice_partners.splice(seed, data)
+        if spliced is not None:
+            # the partner can't be replayed on another seed
+            discard_recipe()
+        return spliced
+
+    def fallback_mutation(self):
+        """An operator to use instead of a splice that found no partner, so the seed isn't run unchanged."""
+        mutations = ['flip', 'bit_flip', 'byte_flip', 'arithmetic',
+                     'interesting_value', 'chunk_replacement', 'duplicate_chunk']
+        if token_dictionary:
+            mutations += ['token_insert', 'token_overwrite']
+        return random.choice(mutations)
 
 class HavocMutator:
     def __init__(self, max_mutations=6):
@@ -238,13 +488,14 @@ class HavocMutator:
     def mutate(self, conf, seed, queue=None):
         mutations = ['bit_flip', 'byte_flip', 'arithmetic', 
                     'interesting_value', 'chunk_replacement', 'duplicate_chunk']
+        if token_dictionary:
+            mutations += ['token_insert', 'token_overwrite']
         
         # Pick how many mutations to apply
         num_mutations = random.randint(1, self.max_mutations)
         
         # Start with original data
-        with open(seed.path, 'rb') as f:
-            data = bytearray(f.read())
+        data = bytearray(read_input(seed.path))
         
         # Create temporary file for intermediate mutations
         temp_path = conf['current_input']
@@ -272,11 +523,12 @@ class HavocMutator:
     def mutate(self, conf, seed, queue=None):
         mutations = ['bit_flip', 'byte_flip', 'arithmetic', 
                     'interesting_value', 'chunk_replacement', 'duplicate_chunk']
+        if token_dictionary:
+            mutations += ['token_insert', 'token_overwrite']
         
         num_mutations = random.randint(1, self.max_mutations)
         
-        with open(seed.path, 'rb') as f:
-            data = bytearray(f.read())
+        data = bytearray(read_input(seed.path))
         
         temp_path = conf['current_input']
         temp_conf = {'current_input': temp_path}
@@ -293,7 +545,27 @@ class HavocMutator:
                 
         return True
 
+def replay_recipe(conf, seed, recipe):
+    """Apply a recipe from the recipe book to the seed and write the result to current_input."""
+    global last_strategy, last_seed_id, current_recipe
+    token_dictionary.used.clear()
+    last_strategy = 'replay'
+    last_seed_id = seed.seed_id
+    seed.replayed.add(recipe)
+    # recording is off, the recipe is credited as a whole instead
+    current_recipe = None
+    data = DeterministicMutator().replay(bytearray(read_input(seed.path)), recipe)
+    with open(conf['current_input'], 'wb') as f:
+        f.write(data)
+    current_recipe = recipe
+    return data
+
+
 def havoc_mutation(conf, seed, queue=None):
+    global last_strategy, last_seed_id, current_recipe
+    token_dictionary.used.clear()
+    last_seed_id = seed.seed_id
+    current_recipe = []
     strategy_roll = random.random()
     mutator = DeterministicMutator()
     havoc = HavocMutator()
@@ -302,14 +574,16 @@ def havoc_mutation(conf, seed, queue=None):
     if strategy_roll < 0.90:  # 90% chance for single deterministic mutation
         weighted_mutations = [
             ('flip', 4),
-            ('splice', 5 if queue and len(queue) > 1 else 0),
-            ('splice_havoc', 1 if queue and len(queue) > 1 else 0),
+            ('splice', 5 if len(splice_partners) > 1 else 0),
+            ('splice_havoc', 1 if len(splice_partners) > 1 else 0),
             ('bit_flip', 1),
             ('byte_flip', 1),
             ('arithmetic', 1),
             ('interesting_value', 1),
             ('chunk_replacement', 1),
-            ('duplicate_chunk', 1)
+            ('duplicate_chunk', 1),
+            ('token_insert', 2 if token_dictionary else 0),
+            ('token_overwrite', 2 if token_dictionary else 0)
         ]
         
         possible_mutations = [m for m in weighted_mutations if m[1] > 0]
@@ -321,15 +595,18 @@ def havoc_mutation(conf, seed, queue=None):
         for mutation_type, weight in possible_mutations:
             current_weight += weight
             if r <= current_weight:
+                last_strategy = 'splice' if mutation_type.startswith('splice') else 'deterministic'
                 if mutation_type == 'splice_havoc':
                     # Handle splice mutation
                     result = splice.mutate(seed, queue, conf)
                     if result is None:
-                        # If splice fails, return None or could try havoc
-                        return None
+                        # no partner to splice with, current_input still holds the last input
+                        last_strategy = 'deterministic'
+                        return mutator.mutate(conf, seed, queue, mutator.fallback_mutation())
                     return result
                 else:
                     return mutator.mutate(conf, seed, queue, mutation_type)
     
     else:  # 10% chance for havoc
+        last_strategy = 'havoc'
         return havoc.mutate(conf, seed, queue)
\ No newline at end of file
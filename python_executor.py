@@ -0,0 +1,205 @@
+import ctypes
+import importlib
+import importlib.util
+import os
+import re
+import select
+import signal
+import struct
+import sys
+import time
+import zlib
+from execution import TIMEOUT_SEC
+from feedback import MAP_SIZE, PYTHON_EXCEPTION_STATUS, clear_shm
+
+# the status we report when the worker had to be killed, same as a forkserver timeout
+TIMEOUT_STATUS = 9
+
+# worker -> fuzzer reply: status code, then the length of the crash bucket that follows
+REPLY_HEADER = struct.Struct('<IH')
+
+
+def load_callable(spec):
+    """Load 'path/to/file.py:function' or 'package.module:function'."""
+    module_name, _, func_name = spec.rpartition(':')
+    if module_name.endswith('.py'):
+        module_spec = importlib.util.spec_from_file_location('mini_lop_target', module_name)
+        module = importlib.util.module_from_spec(module_spec)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(module_name)))
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    return getattr(module, func_name)
+
+
+def crash_bucket(exc):
+    """Bucket an uncaught exception by its type and the location it was raised at."""
+    tb = exc.__traceback__
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    location = f'{os.path.basename(tb.tb_frame.f_code.co_filename)}:{tb.tb_lineno}'
+    return re.sub(r'[^A-Za-z0-9_.:@-]', '_', f'{type(exc).__name__}@{location}')
+
+
+class CoverageTracer:
+    """Hashes the branches and line transitions of the target into an AFL-style trace_bits map."""
+
+    def __init__(self, trace_bits):
+        self.bitmap = (ctypes.c_ubyte * MAP_SIZE).from_address(trace_bits)
+        self.code_keys = {}
+        self.prev_loc = 0
+
+    def _code_key(self, code):
+        key = self.code_keys.get(code)
+        if key is None:
+            # must not depend on object addresses or hash seeds, so edge ids stay the same across runs
+            key = zlib.crc32(f'{code.co_filename}:{code.co_firstlineno}:{code.co_name}'.encode())
+            self.code_keys[code] = key
+        return key
+
+    def _hit(self, index):
+        self.bitmap[index] = (self.bitmap[index] + 1) & 0xff
+
+    def on_branch(self, code, src_offset, dst_offset):
+        key = self._code_key(code)
+        self._hit((key ^ (src_offset * 2654435761) ^ (dst_offset << 1)) % MAP_SIZE)
+
+    def on_line(self, code, line):
+        # the same prev_loc/cur_loc trick AFL uses for basic blocks
+        cur_loc = (self._code_key(code) ^ (line * 2654435761)) % MAP_SIZE
+        self._hit(cur_loc ^ self.prev_loc)
+        self.prev_loc = cur_loc >> 1
+
+    def _settrace_local(self, frame, event, arg):
+        if event == 'line':
+            self.on_line(frame.f_code, frame.f_lineno)
+        return self._settrace_local
+
+    def _settrace_global(self, frame, event, arg):
+        return self._settrace_local
+
+    def start(self):
+        self.prev_loc = 0
+        if hasattr(sys, 'monitoring'):
+            # PEP 669, only available from Python 3.12
+            monitoring = sys.monitoring
+            if monitoring.get_tool(monitoring.COVERAGE_ID) is None:
+                monitoring.use_tool_id(monitoring.COVERAGE_ID, 'mini-lop')
+            # registered every time, an earlier tracer (e.g. of the previous benchmark repeat) may still own them
+            monitoring.register_callback(monitoring.COVERAGE_ID, monitoring.events.BRANCH, self.on_branch)
+            monitoring.register_callback(monitoring.COVERAGE_ID, monitoring.events.LINE, self.on_line)
+            monitoring.set_events(monitoring.COVERAGE_ID, monitoring.events.BRANCH | monitoring.events.LINE)
+        else:
+            # older interpreters only get line transitions, through the much slower settrace
+            sys.settrace(self._settrace_global)
+
+    def stop(self):
+        if hasattr(sys, 'monitoring'):
+            sys.monitoring.set_events(sys.monitoring.COVERAGE_ID, 0)
+        else:
+            sys.settrace(None)
+
+
+class PythonTarget:
+    """Runs a Python callable on each input, either in-process or in a forked worker, like run_target does for binaries."""
+
+    def __init__(self, conf, trace_bits):
+        self.input_path = conf['current_input']
+        self.trace_bits = trace_bits
+        self.func = load_callable(conf['target'])
+        self.isolation = conf.get('python_isolation', 'fork')
+        self.tracer = CoverageTracer(trace_bits)
+        # exception type and location of the last crash, used to name the crash file
+        self.last_crash_bucket = None
+        self.worker_pid = None
+        if self.isolation == 'fork':
+            self._spawn_worker()
+
+    def wait_ready(self):
+        return True
+
+    def _call(self):
+        """Run the callable once on the current input, return (status, bucket)."""
+        with open(self.input_path, 'rb') as f:
+            data = f.read()
+        error = None
+        self.tracer.start()
+        try:
+            self.func(data)
+        except Exception as e:
+            error = e
+        finally:
+            self.tracer.stop()
+        if error is None:
+            return 0, ''
+        # bucketing runs the fuzzer's own code, keep it out of the trace
+        return PYTHON_EXCEPTION_STATUS, crash_bucket(error)
+
+    def _spawn_worker(self):
+        (ctl_read_fd, self.ctl_write_fd) = os.pipe()
+        (self.st_read_fd, st_write_fd) = os.pipe()
+        self.worker_pid = os.fork()
+        if self.worker_pid == 0:
+            os.close(self.ctl_write_fd)
+            os.close(self.st_read_fd)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # eats stdout and stderr of the target
+            dev_null_fd = os.open(os.devnull, os.O_RDWR)
+            os.dup2(dev_null_fd, 1)
+            os.dup2(dev_null_fd, 2)
+            try:
+                while os.read(ctl_read_fd, 1):
+                    status, bucket = self._call()
+                    encoded = bucket.encode()
+                    os.write(st_write_fd, REPLY_HEADER.pack(status, len(encoded)) + encoded)
+            finally:
+                # never unwind into the fuzzer's code, e.g. when the target calls sys.exit()
+                os._exit(0)
+        os.close(ctl_read_fd)
+        os.close(st_write_fd)
+
+    def _kill_worker(self):
+        try:
+            os.kill(self.worker_pid, signal.SIGKILL)
+        except OSError:
+            pass
+        _, status = os.waitpid(self.worker_pid, 0)
+        os.close(self.ctl_write_fd)
+        os.close(self.st_read_fd)
+        return status
+
+    def close(self):
+        if self.worker_pid is not None:
+            self._kill_worker()
+            self.worker_pid = None
+
+    def run(self):
+        clear_shm(self.trace_bits)
+        self.last_crash_bucket = None
+        start_time = time.time()
+
+        if self.isolation != 'fork':
+            # no way to interrupt the callable here, use the fork isolation for targets that may hang
+            status, bucket = self._call()
+            self.last_crash_bucket = bucket or None
+            return status, time.time() - start_time
+
+        os.write(self.ctl_write_fd, b'\x01')
+        ready, _, _ = select.select([self.st_read_fd], [], [], TIMEOUT_SEC)
+        if not ready:
+            self._kill_worker()
+            self._spawn_worker()
+            return TIMEOUT_STATUS, time.time() - start_time
+
+        header = os.read(self.st_read_fd, REPLY_HEADER.size)
+        if len(header) < REPLY_HEADER.size:
+            # the worker died on its own, e.g. a crash inside a C extension
+            status = self._kill_worker()
+            self._spawn_worker()
+            self.last_crash_bucket = f'sig{status & 0x7f}'
+            return status, time.time() - start_time
+
+        status, bucket_len = REPLY_HEADER.unpack(header)
+        if bucket_len:
+            self.last_crash_bucket = os.read(self.st_read_fd, bucket_len).decode()
+        return status, time.time() - start_time
@@ -1,4 +1,6 @@
+import math
 import random
+from array import array
 import seed
 import os
 from typing import List  # Import List from typing module
@@ -7,6 +9,28 @@ from typing import List  # Import List from typing module
 priority_set = set()
 queue_position = 0
 
+# number of executions that took each path (n_fuzz in AFLFast), indexed by trace checksum
+# modulo its size like AFL++ does, so it stays the same size however many paths are seen
+N_FUZZ_SIZE = 1 << 21
+path_frequency = array('I', bytes(4 * N_FUZZ_SIZE))
+
+# AFLFast caps the schedule factor at this value
+MAX_FACTOR = 32
+HAVOC_MAX_MULT = 200
+
+def reset_schedule_state():
+    global queue_position
+    priority_set.clear()
+    path_frequency[:] = array('I', bytes(4 * N_FUZZ_SIZE))
+    queue_position = 0
+
+def keep_cycle_position(old_queue, kept):
+    """Continue the current cycle after seeds were dropped from the queue, at the same place among the kept seeds."""
+    global queue_position
+    kept_set = set(kept)
+    queue_position = sum(1 for seed in old_queue[:queue_position] if seed in kept_set)
+    priority_set.intersection_update(kept_set)
+
 def sort_seeds(seed_queue: List[seed.Seed]):
     def seed_sort_key(seed: seed.Seed):
         # Create tuple for sorting
@@ -71,7 +95,7 @@ def select_next_seed(seed_queue: List[seed.Seed], num_branches):
     return seed_queue[0]
 
 
-def get_power_schedule(seed, total_cal_us=0, total_cal_cycles=0, total_bitmap_size=0, total_bitmap_entries=0):
+def get_perf_score(seed, total_cal_us=0, total_cal_cycles=0, total_bitmap_size=0, total_bitmap_entries=0):
     # Base performance score
     perf_score = 100
     
@@ -118,9 +142,10 @@ def get_power_schedule(seed, total_cal_us=0, total_cal_cycles=0, total_bitmap_si
 
     # For handicap and depth adjustments, we'll need to add these fields to your Seed class
     # For now, we'll use a simplified version
-    
-    HAVOC_MAX_MULT = 200
-    
+    return perf_score
+
+
+def perf_score_to_power(perf_score):
     # Scale the perf_score to actual number of iterations
     # The division by 100 is to normalize the perf_score which started at base 100
     power = min(int((perf_score / 100)), HAVOC_MAX_MULT)
@@ -128,6 +153,99 @@ def get_power_schedule(seed, total_cal_us=0, total_cal_cycles=0, total_bitmap_si
     # Ensure we always do at least one iteration
     return max(power, 1)
 
+
+def get_power_schedule(seed, total_cal_us=0, total_cal_cycles=0, total_bitmap_size=0, total_bitmap_entries=0):
+    return perf_score_to_power(get_perf_score(seed, total_cal_us, total_cal_cycles, total_bitmap_size, total_bitmap_entries))
+
+
+def record_execution(seed, checksum, track_species=False):
+    """Count the path taken by one execution of a mutant of seed, species are only needed by the entropic schedule."""
+    path_frequency[checksum % N_FUZZ_SIZE] += 1
+    if track_species:
+        count = seed.species.get(checksum, 0)
+        seed.species[checksum] = count + 1
+        # keep sum(c * log(c)) up to date, seed_entropy only needs that and the total
+        seed.species_plogp += (count + 1) * math.log(count + 1) - (count * math.log(count) if count else 0)
+        seed.species_total += 1
+
+
+def get_path_frequency(checksum):
+    return path_frequency[checksum % N_FUZZ_SIZE] if checksum is not None else 0
+
+
+def _fast_factor(seed):
+    fuzz = get_path_frequency(seed.path_checksum)
+    if seed.fuzz_level < 16:
+        return (1 << seed.fuzz_level) / max(fuzz, 1)
+    return MAX_FACTOR / max(fuzz, 1)
+
+
+def explore_factor(seed, seed_queue, global_bitmap):
+    return 1
+
+
+def fast_factor(seed, seed_queue, global_bitmap):
+    return _fast_factor(seed)
+
+
+def coe_factor(seed, seed_queue, global_bitmap):
+    # seeds whose path was fuzzed more often than the average get (almost) no energy
+    fuzz = get_path_frequency(seed.path_checksum)
+    fuzz_mu = sum(get_path_frequency(s.path_checksum) for s in seed_queue) / len(seed_queue)
+    if fuzz > fuzz_mu:
+        return 0
+    return _fast_factor(seed)
+
+
+def rare_factor(seed, seed_queue, global_bitmap):
+    # FairFuzz: an edge is rare if it was hit at most by the smallest power of two
+    # above the hit count of the rarest edge
+    if seed.edges is None or not global_bitmap:
+        return 1
+    rarity_cutoff = 1 << math.ceil(math.log2(min(global_bitmap.values())))
+    rare_edges = sum(1 for edge in seed.edges if global_bitmap.get(edge, 0) <= rarity_cutoff)
+    if rare_edges == 0:
+        return 0.25
+    return 1 + rare_edges
+
+
+def seed_entropy(seed):
+    # Entropic: the paths taken by the seed's mutants are the species, unseen species are
+    # accounted for by giving every seed one extra singleton observation. With that total T,
+    # -sum(c/T * log(c/T)) works out to log(T) - sum(c * log(c)) / T
+    total = seed.species_total + 1
+    return math.log(total) - seed.species_plogp / total
+
+
+def entropic_factor(seed, seed_queue, global_bitmap):
+    if not seed.species_total:
+        # never fuzzed, nothing is known yet, so explore it
+        return MAX_FACTOR
+    fuzzed = [s for s in seed_queue if s.species_total]
+    mean_entropy = sum(seed_entropy(s) for s in fuzzed) / len(fuzzed)
+    if mean_entropy == 0:
+        return 1
+    return seed_entropy(seed) / mean_entropy
+
+
+# factor applied to the default perf score, selected with power_schedule in the config
+POWER_SCHEDULES = {
+    'default': None,
+    'explore': explore_factor,
+    'fast': fast_factor,
+    'coe': coe_factor,
+    'rare': rare_factor,
+    'entropic': entropic_factor,
+}
+
+
+def get_scheduled_power(schedule, seed, seed_queue, global_bitmap, stats):
+    perf_score = get_perf_score(seed, *stats)
+    factor_func = POWER_SCHEDULES[schedule]
+    if factor_func is not None:
+        perf_score *= min(factor_func(seed, seed_queue, global_bitmap), MAX_FACTOR)
+    return perf_score_to_power(perf_score)
+
 def calculate_statistics(seed_queue):
     total_cal_us = sum(seed.exec_time for seed in seed_queue)
     total_cal_cycles = len(seed_queue)
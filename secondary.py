@@ -0,0 +1,95 @@
+import os
+import queue
+import threading
+from affinity import leave_bound_core
+from execution import ForkserverTarget, run_forkserver
+from feedback import SHM_ENV_VAR, check_crash, setup_shm, trace_checksum
+from storage import open_store
+
+# inputs waiting for the secondary targets, once full new inputs are dropped instead of blocking
+SECONDARY_QUEUE_SIZE = 1000
+
+
+class SecondaryTarget:
+    """A slower build (e.g. ASan) with its own forkserver and map, fed from a queue by a worker thread."""
+
+    def __init__(self, sec_conf, libc):
+        self.name = sec_conf['name']
+        self.conf = sec_conf
+        self.shmid, self.trace_bits = setup_shm(libc)
+        self.crash_store = open_store(sec_conf, 'crashes')
+        self.crash_checksums = set()
+        self.inputs = queue.Queue(SECONDARY_QUEUE_SIZE)
+        self.execs = 0
+        self.crashes = 0
+        self.dropped = 0
+
+        (st_read_fd, st_write_fd) = os.pipe()
+        (ctl_read_fd, ctl_write_fd) = os.pipe()
+        child_pid = os.fork()
+        if child_pid == 0:
+            try:
+                os.environ[SHM_ENV_VAR] = str(self.shmid)
+                leave_bound_core()
+                run_forkserver(sec_conf, ctl_read_fd, st_write_fd)
+            finally:
+                # execv failed, never fall back into the fuzzer's code
+                os._exit(1)
+        os.close(ctl_read_fd)
+        os.close(st_write_fd)
+        self.target = ForkserverTarget(ctl_write_fd, st_read_fd, self.trace_bits, child_pid)
+
+        self.thread = threading.Thread(target=self._work, name=f'secondary-{self.name}', daemon=True)
+
+    def submit(self, kind, data):
+        """Queue an input the fast target promoted, kind is 'queue' or 'crash'. Never blocks."""
+        try:
+            self.inputs.put_nowait((kind, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def _work(self):
+        if not self.target.wait_ready():
+            print(f"[{self.name}] forkserver did not start")
+            return
+        while True:
+            item = self.inputs.get()
+            if item is None:
+                return
+            kind, data = item
+            with open(self.conf['current_input'], 'wb') as f:
+                f.write(data)
+            status_code, _ = self.target.run()
+            self.execs += 1
+            if status_code == 9 or not check_crash(status_code):
+                continue
+            checksum = trace_checksum(self.trace_bits)
+            if checksum in self.crash_checksums:
+                continue
+            self.crash_checksums.add(checksum)
+            self.crashes += 1
+            # the name says which build found it and whether the fast build crashed on it too
+            self.crash_store.add(data, f'{len(self.crash_store)}_{self.name}_{kind}_{self.target.last_crash_bucket}_{checksum:016x}')
+            print(f"[{self.name}] found a crash on a {kind} input, status code is {status_code}")
+
+    def close(self):
+        # drop what is still pending, the worker finishes the input it is running
+        while not self.inputs.empty():
+            try:
+                self.inputs.get_nowait()
+            except queue.Empty:
+                break
+        self.inputs.put(None)
+        self.thread.join()
+        self.target.close()
+
+    def status(self):
+        return f'{self.name}: {self.execs} execs, {self.crashes} crashes, {self.inputs.qsize()} pending, {self.dropped} dropped'
+
+
+def start_secondary_targets(conf, libc):
+    # fork every forkserver before any worker thread exists
+    secondaries = [SecondaryTarget(sec_conf, libc) for sec_conf in conf.get('secondary_targets', [])]
+    for secondary in secondaries:
+        secondary.thread.start()
+    return secondaries
@@ -1,14 +1,26 @@
 class Seed:
-    def __init__(self, path, seed_id, coverage, exec_time, file_size):
+    def __init__(self, path, seed_id, coverage, exec_time, file_size, edges=None):
         self.path = path
         self.seed_id = seed_id
         self.coverage = coverage
         self.exec_time = exec_time
         self.visited = True
         self.file_size = file_size
+        # sorted array('H') of the edge ids this seed covers
+        self.edges = edges
         # by default, a seed is not marked as favored
         self.favored = 0
         self.crash = False
+        # checksum of the seed's own trace, and how often the seed was picked for fuzzing
+        self.path_checksum = None
+        self.fuzz_level = 0
+        # path checksum -> number of mutants of this seed that took that path, with the
+        # running total and sum(c * log(c)) the entropy is computed from (entropic schedule only)
+        self.species = {}
+        self.species_total = 0
+        self.species_plogp = 0.0
+        # recipes from the recipe book already replayed on this seed
+        self.replayed = set()
 
     def mark_crash(self):
         self.crash = True
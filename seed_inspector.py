@@ -2,6 +2,7 @@ import argparse
 import os
 import subprocess
 from conf import *
+from edge_db import *
 
 
 def sorted_directory_listing_by_creation_time_with_os_listdir(directory):
@@ -13,6 +14,25 @@ def sorted_directory_listing_by_creation_time_with_os_listdir(directory):
     sorted_items = sorted(items, key=get_creation_time)
     return sorted_items
 
+def inspect_edge_db(conf):
+    initial_seeds = set(os.listdir(conf['seeds_folder']))
+    db = EdgeDB(conf['edge_db_folder'], read_only=True)
+
+    all_edges = set()
+    for name, _, _, edges in db.records():
+        if name in initial_seeds:
+            all_edges.update(edges)
+
+    print(f'Initial seeds cover {len(all_edges)} edges')
+
+    for name, _, _, edges in db.records():
+        if name not in initial_seeds:
+            edges_before = len(all_edges)
+            all_edges.update(edges)
+            edges_after = len(all_edges)
+            print(f'Seed: {os.path.join(conf["queue_folder"], name)} covers {edges_after - edges_before} new edges')
+
+
 def main():
 
     print("====== Welcome to use Mini-Lop's Seed Inspector ======")
@@ -31,6 +51,11 @@ def main():
         print("Config file is not valid")
         return
 
+    # the fuzzer records the edges of every queue entry, so there is no need to run the target again
+    if os.path.exists(os.path.join(conf['edge_db_folder'], 'index')):
+        inspect_edge_db(conf)
+        return
+
     afl_showmap_path = '/usr/local/bin/afl-showmap'
 
     if not os.path.exists(afl_showmap_path):
@@ -0,0 +1,221 @@
+import argparse
+import mmap
+import os
+import struct
+from conf import *
+
+
+# a new segment file is started once the current one would grow past this size
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+# index record: segment number, offset in the segment, entry length, name length
+# the name bytes follow each record
+INDEX_RECORD = struct.Struct('<IQIH')
+
+
+def read_input(handle):
+    """Return the bytes of a corpus entry, whether it is a plain path or a segment handle."""
+    if isinstance(handle, str):
+        with open(handle, 'rb') as f:
+            return f.read()
+    return handle.read()
+
+
+class SegmentHandle:
+    """Points at one entry of a SegmentStore, this is what Seed.path holds for the segment backend."""
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def name(self):
+        return self.store.entries[self.index][3]
+
+    def read(self):
+        return self.store.read(self.index)
+
+    def __eq__(self, other):
+        return isinstance(other, SegmentHandle) and other.store is self.store and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    def __str__(self):
+        return f'{self.store.folder}#{self.index}'
+
+    __repr__ = __str__
+
+
+class FileStore:
+    """The classic layout: one file per entry, the handle is the file path."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.count = len(os.listdir(folder))
+
+    def __len__(self):
+        return self.count
+
+    def add(self, data, name=None):
+        if name is None:
+            name = str(self.count)
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.count += 1
+        return path
+
+    def export(self, dest):
+        # the files already are the plain layout
+        if os.path.abspath(dest) == os.path.abspath(self.folder):
+            return self.count
+        os.makedirs(dest, exist_ok=True)
+        for name in os.listdir(self.folder):
+            with open(os.path.join(self.folder, name), 'rb') as src, open(os.path.join(dest, name), 'wb') as dst:
+                dst.write(src.read())
+        return self.count
+
+
+class SegmentStore:
+    """Append-only segment files plus an offset/length index, entries are read back through mmap."""
+
+    def __init__(self, folder, segment_size=SEGMENT_SIZE, read_only=False):
+        self.folder = folder
+        self.segment_size = segment_size
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(folder, exist_ok=True)
+
+        # (segment, offset, length, name) for every entry, in insertion order
+        self.entries = []
+        self.maps = {}
+        self.index_path = os.path.join(folder, 'index')
+        self._load_index()
+
+        self.segment = self.entries[-1][0] if self.entries else 0
+        if read_only:
+            # inspection tools never create or touch files in the output folder
+            return
+        self.segment_file = open(self._segment_path(self.segment), 'ab')
+        self.write_offset = self.segment_file.tell()
+        self.index_file = open(self.index_path, 'ab')
+
+    def _segment_path(self, segment):
+        return os.path.join(self.folder, f'segment_{segment:06d}')
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'rb') as f:
+            raw = f.read()
+        pos = 0
+        while pos + INDEX_RECORD.size <= len(raw):
+            segment, offset, length, name_len = INDEX_RECORD.unpack_from(raw, pos)
+            pos += INDEX_RECORD.size
+            if pos + name_len > len(raw):
+                # a torn write at the end of the index, drop the partial record
+                break
+            name = raw[pos:pos + name_len].decode()
+            pos += name_len
+            self.entries.append((segment, offset, length, name))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, data, name=None):
+        if self.read_only:
+            raise ValueError(f'{self.folder} was opened read-only')
+        if name is None:
+            name = str(len(self.entries))
+
+        if self.write_offset > 0 and self.write_offset + len(data) > self.segment_size:
+            self.segment_file.close()
+            self.segment += 1
+            self.segment_file = open(self._segment_path(self.segment), 'ab')
+            self.write_offset = 0
+
+        offset = self.write_offset
+        self.segment_file.write(data)
+        self.segment_file.flush()
+        self.write_offset += len(data)
+
+        encoded_name = name.encode()
+        self.index_file.write(INDEX_RECORD.pack(self.segment, offset, len(data), len(encoded_name)) + encoded_name)
+        self.index_file.flush()
+
+        self.entries.append((self.segment, offset, len(data), name))
+        return SegmentHandle(self, len(self.entries) - 1)
+
+    def handles(self):
+        return [SegmentHandle(self, i) for i in range(len(self.entries))]
+
+    def read(self, index):
+        segment, offset, length, _ = self.entries[index]
+        if length == 0:
+            return memoryview(b'')
+
+        mapped = self.maps.get(segment)
+        if mapped is None or len(mapped) < offset + length:
+            # the segment grew since it was last mapped, map it again
+            # the old map stays alive as long as someone holds a view of it
+            with open(self._segment_path(segment), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[segment] = mapped
+
+        return memoryview(mapped)[offset:offset + length]
+
+    def export(self, dest):
+        os.makedirs(dest, exist_ok=True)
+        for i, entry in enumerate(self.entries):
+            with open(os.path.join(dest, entry[3]), 'wb') as f:
+                f.write(self.read(i))
+        return len(self.entries)
+
+
+def open_store(conf, kind):
+    """Open the store for 'queue' or 'crashes' according to the corpus_storage option."""
+    folder = conf[f'{kind}_folder']
+    if conf.get('corpus_storage', 'files') == 'segments':
+        return SegmentStore(folder + '_segments')
+    return FileStore(folder)
+
+
+def main():
+
+    print("====== Welcome to use Mini-Lop's Corpus Exporter ======")
+
+    parser = argparse.ArgumentParser(description='export a segment-backed corpus to one file per entry')
+
+    parser.add_argument('--config', '-c', required=True, help='Path to config file', type=str)
+    parser.add_argument('--dest', '-d', help='Export into this folder instead of the output folder', type=str)
+
+    args = parser.parse_args()
+
+    config_path = os.path.abspath(args.config)
+
+    config_valid, conf = parse_config(config_path, overwrite_output=False)
+
+    if not config_valid:
+        print("Config file is not valid")
+        return
+
+    if conf.get('corpus_storage', 'files') != 'segments':
+        print("corpus_storage is not 'segments', the output folder already has the plain layout")
+        return
+
+    for kind in ['queue', 'crashes']:
+        dest = os.path.join(args.dest, kind) if args.dest else conf[f'{kind}_folder']
+        folder = conf[f'{kind}_folder'] + '_segments'
+        if not os.path.exists(os.path.join(folder, 'index')):
+            print(f'No {kind} segments found in {folder}, has the fuzzer been run with this config?')
+            continue
+        store = SegmentStore(folder, read_only=True)
+        count = store.export(dest)
+        print(f'Exported {count} {kind} entries to {dest}')
+
+
+if __name__ == '__main__':
+    main()
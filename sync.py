@@ -0,0 +1,238 @@
+import argparse
+import json
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from hashlib import sha256
+
+from feedback import MAP_SIZE
+
+DEFAULT_PORT = 7301
+
+# every message is a JSON header and a zlib-compressed payload, prefixed by their lengths
+FRAME = struct.Struct('<II')
+MAX_MESSAGE = 64 * 1024 * 1024
+# upper bound on the entries sent back by one pull
+MAX_PULL_ENTRIES = 64
+
+
+def send_message(sock, header, payload=b''):
+    encoded = json.dumps(header).encode()
+    compressed = zlib.compress(payload)
+    sock.sendall(FRAME.pack(len(encoded), len(compressed)) + encoded + compressed)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('connection closed by peer')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_message(sock):
+    header_len, payload_len = FRAME.unpack(_recv_exactly(sock, FRAME.size))
+    if header_len + payload_len > MAX_MESSAGE:
+        raise ConnectionError('message too large')
+    header = json.loads(_recv_exactly(sock, header_len))
+    decompressor = zlib.decompressobj()
+    payload = decompressor.decompress(_recv_exactly(sock, payload_len), MAX_MESSAGE)
+    if decompressor.unconsumed_tail:
+        raise ConnectionError('message too large')
+    return header, payload
+
+
+def edges_to_bytes(edges):
+    # edge sets travel as little-endian array('H')
+    if sys.byteorder == 'big':
+        edges = array('H', edges)
+        edges.byteswap()
+    return edges.tobytes()
+
+
+def edges_from_bytes(raw):
+    edges = array('H')
+    edges.frombytes(raw)
+    if sys.byteorder == 'big':
+        edges.byteswap()
+    return edges
+
+
+def pack_entries(entries):
+    """Turn [(data, edges)] into a header list and one payload."""
+    headers = []
+    payload = bytearray()
+    for data, edges in entries:
+        headers.append({'hash': sha256(data).hexdigest(), 'size': len(data), 'edges': len(edges)})
+        payload += data
+        payload += edges_to_bytes(edges)
+    return headers, bytes(payload)
+
+
+def unpack_entries(headers, payload):
+    entries = []
+    pos = 0
+    for header in headers:
+        data = payload[pos:pos + header['size']]
+        pos += header['size']
+        edges = edges_from_bytes(payload[pos:pos + header['edges'] * 2])
+        pos += header['edges'] * 2
+        if sha256(data).hexdigest() == header['hash']:
+            entries.append((header['hash'], data, edges))
+    return entries
+
+
+def edge_bitmap(edges):
+    """A MAP_SIZE bit set of the edges a node has, that is what a pull sends."""
+    bitmap = bytearray(MAP_SIZE // 8)
+    for edge in edges:
+        bitmap[edge >> 3] |= 1 << (edge & 7)
+    return bytes(bitmap)
+
+
+class SyncServer(socketserver.ThreadingTCPServer):
+    """Keeps every entry any node pushed, deduplicated by content hash."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, SyncRequestHandler)
+        self.lock = threading.Lock()
+        # (hash, node that pushed it, data, edges) in the order they arrived
+        self.entries = []
+        self.hashes = set()
+        # node -> hashes the node already has, because it pushed them or acknowledged pulling them
+        self.sent = {}
+
+    def add_entries(self, node, entries):
+        accepted = 0
+        with self.lock:
+            known = self.sent.setdefault(node, set())
+            for entry_hash, data, edges in entries:
+                known.add(entry_hash)
+                if entry_hash not in self.hashes:
+                    self.hashes.add(entry_hash)
+                    self.entries.append((entry_hash, node, data, edges))
+                    accepted += 1
+        return accepted
+
+    def acknowledge(self, node, hashes):
+        """The node received these entries with its last pull, they are not offered to it again."""
+        with self.lock:
+            self.sent.setdefault(node, set()).update(hashes)
+
+    def entries_for(self, node, bitmap):
+        """Entries that cover an edge the node does not have yet, without two entries for the same new edge."""
+        covered = bytearray(bitmap)
+        selected = []
+        with self.lock:
+            entries = list(self.entries)
+            known = set(self.sent.get(node, ()))
+        for entry_hash, owner, data, edges in entries:
+            if owner == node or entry_hash in known:
+                continue
+            new_edges = [edge for edge in edges if not covered[edge >> 3] & (1 << (edge & 7))]
+            if not new_edges:
+                continue
+            for edge in new_edges:
+                covered[edge >> 3] |= 1 << (edge & 7)
+            selected.append((data, edges))
+            if len(selected) >= MAX_PULL_ENTRIES:
+                break
+        return selected
+
+
+class SyncRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            header, payload = recv_message(self.request)
+            if header.get('op') == 'push':
+                entries = unpack_entries(header['entries'], payload)
+                accepted = self.server.add_entries(header['node'], entries)
+                send_message(self.request, {'accepted': accepted})
+            elif header.get('op') == 'pull':
+                if len(payload) != MAP_SIZE // 8:
+                    send_message(self.request, {'error': 'bad edge bitmap'})
+                    return
+                self.server.acknowledge(header['node'], header.get('ack', []))
+                selected = self.server.entries_for(header['node'], payload)
+                headers, reply = pack_entries(selected)
+                send_message(self.request, {'entries': headers}, reply)
+            else:
+                send_message(self.request, {'error': 'unknown op'})
+        except (ConnectionError, ValueError, KeyError, zlib.error) as e:
+            print(f"Dropped a sync request from {self.client_address[0]}: {e}")
+
+
+class SyncClient:
+    """Pushes a node's new queue entries to a SyncServer and pulls the ones that add edges."""
+
+    def __init__(self, address, node):
+        host, _, port = address.rpartition(':')
+        self.address = (host, int(port))
+        self.node = node
+        # hashes the server already has from this node or sent to it, they are not pushed again
+        self.known = set()
+        # hashes received with the last pull, acknowledged with the next one
+        self.unacked = []
+
+    def _request(self, header, payload=b''):
+        with socket.create_connection(self.address, timeout=10) as sock:
+            send_message(sock, header, payload)
+            reply, reply_payload = recv_message(sock)
+        if 'error' in reply:
+            raise ConnectionError(reply['error'])
+        return reply, reply_payload
+
+    def push(self, entries):
+        """entries is a list of (data, edges), returns how many the server did not have yet."""
+        # entries pulled from the server come back through the queue, don't send them again
+        entries = [(data, edges) for data, edges in entries if sha256(data).hexdigest() not in self.known]
+        if not entries:
+            return 0
+        headers, payload = pack_entries(entries)
+        reply, _ = self._request({'op': 'push', 'node': self.node, 'entries': headers}, payload)
+        # only once the server has them, a failed push is sent again with the next one
+        self.known.update(header['hash'] for header in headers)
+        return reply['accepted']
+
+    def pull(self, edges):
+        """Returns [(data, edges)] of entries covering edges that are not in the given edge ids."""
+        # the server remembers what this node pushed and acknowledged, so only the last pull is sent along
+        reply, payload = self._request({'op': 'pull', 'node': self.node, 'ack': self.unacked}, edge_bitmap(edges))
+        entries = unpack_entries(reply['entries'], payload)
+        self.unacked = [entry_hash for entry_hash, _, _ in entries]
+        # entries may come again when an acknowledgement got lost, they were already returned then
+        new_entries = [(data, edges) for entry_hash, data, edges in entries if entry_hash not in self.known]
+        self.known.update(self.unacked)
+        return new_entries
+
+
+def main():
+
+    print("====== Welcome to use Mini-Lop's Sync Server ======")
+
+    parser = argparse.ArgumentParser(description='share queue entries between mini-lop instances on different machines')
+
+    parser.add_argument('--host', default='0.0.0.0', help='Address to listen on', type=str)
+    parser.add_argument('--port', '-p', default=DEFAULT_PORT, help='Port to listen on', type=int)
+
+    args = parser.parse_args()
+
+    server = SyncServer((args.host, args.port))
+    print(f"Listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stopping, {len(server.entries)} entries were synced")
+
+
+if __name__ == '__main__':
+    main()
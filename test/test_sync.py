@@ -0,0 +1,82 @@
+import threading
+from array import array
+
+import pytest
+
+from sync import SyncClient, SyncServer, edge_bitmap
+
+
+@pytest.fixture
+def server():
+    server = SyncServer(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def address(server):
+    host, port = server.server_address
+    return f'{host}:{port}'
+
+
+def test_push_pull_between_two_nodes(server):
+    a = SyncClient(address(server), 'a')
+    b = SyncClient(address(server), 'b')
+
+    assert a.push([(b'first', array('H', [1, 2])), (b'second', array('H', [2, 3]))]) == 2
+    # a node never gets its own entries back
+    assert a.pull(array('H')) == []
+
+    pulled = b.pull(array('H', [1]))
+    assert [(data, list(edges)) for data, edges in pulled] == [(b'first', [1, 2]), (b'second', [2, 3])]
+    # nothing is sent twice to the same node
+    assert b.pull(array('H')) == []
+
+
+def test_pull_skips_entries_without_new_edges(server):
+    a = SyncClient(address(server), 'a')
+    b = SyncClient(address(server), 'b')
+    a.push([(b'first', array('H', [1, 2])), (b'second', array('H', [2]))])
+
+    pulled = b.pull(array('H', [1]))
+    assert [data for data, _ in pulled] == [b'first']
+
+
+def test_push_dedup(server):
+    a = SyncClient(address(server), 'a')
+    b = SyncClient(address(server), 'b')
+    a.push([(b'same', array('H', [5]))])
+
+    # already known to the server, and not pushed back after b pulled it
+    assert b.push([(b'same', array('H', [5]))]) == 0
+    assert [data for data, _ in b.pull(array('H'))] == []
+    assert a.push([(b'same', array('H', [5]))]) == 0
+    assert len(server.entries) == 1
+
+
+def test_failed_push_is_retried(server):
+    host, port = server.server_address
+    down = SyncServer(('127.0.0.1', 0))
+    closed_port = down.server_address[1]
+    down.server_close()
+
+    a = SyncClient(f'127.0.0.1:{closed_port}', 'a')
+    with pytest.raises(OSError):
+        a.push([(b'entry', array('H', [7]))])
+
+    a.address = (host, port)
+    assert a.push([(b'entry', array('H', [7]))]) == 1
+
+
+def test_lost_pull_reply_is_offered_again(server):
+    a = SyncClient(address(server), 'a')
+    b = SyncClient(address(server), 'b')
+    a.push([(b'entry', array('H', [7]))])
+
+    # selected for b, but the reply never arrived
+    assert len(server.entries_for('b', edge_bitmap(array('H')))) == 1
+    assert [data for data, _ in b.pull(array('H'))] == [b'entry']
+    # acknowledged with this pull, so not offered again
+    assert b.pull(array('H')) == []